@@ -1,13 +1,31 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+
 import controller
 import model
-import simplejson
+import numba
+import orjson
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
 
-app = FastAPI(root_path="/api")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    for pool in PROC_POOLS:
+        pool.shutdown()
+
+
+app = FastAPI(root_path="/api", lifespan=lifespan)
 
 origins = [
     "http://factorio.patrickw.xyz",
@@ -23,15 +41,9 @@ app.add_middleware(
 )
 
 
-class ExtendedJSONResponse(JSONResponse):
-    def render(self, content):
-        return simplejson.dumps(
-            content,
-            ignore_nan=True,
-            ensure_ascii=False,
-            indent=None,
-            separators=(",", ":"),
-        ).encode("utf-8")
+def _encode_json(content) -> bytes:
+    # orjson writes compact UTF-8 and serializes NaN/Infinity as null, so unreachable items keep a null cost
+    return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
 
 
 class ComputeCostsRequest(BaseModel):
@@ -43,10 +55,99 @@ class ComputeCostsResponse(BaseModel):
     costs: list[controller.ItemCost]
 
 
-@app.post("/compute_costs", response_class=ExtendedJSONResponse)
-def compute_costs(request: ComputeCostsRequest) -> ComputeCostsResponse:
-    c = controller.Controller(request.config)
-    return ComputeCostsResponse(costs=c.compute_all_costs(request.iterations))
+# The cost computation is CPU-bound, so it runs in worker processes to keep it off the event loop and
+# out of the GIL. Each worker is its own single-process pool and a config is always sent to the same one (by
+# digest), so that worker's cached Controller is reused instead of every worker building its own. Workers are
+# only started on their first job.
+# The CPUs are split between the workers and each runs the parallel numba kernel on its share: more workers solve
+# more configs at once, more threads per worker solve each one faster. process_cpu_count() follows CPU affinity but
+# not cgroup quotas, so containers should set PYTHON_CPU_COUNT (and SOLVER_WORKERS to tune the split).
+SOLVER_CPUS = os.process_cpu_count() or 1
+SOLVER_WORKERS = max(1, int(os.environ.get("SOLVER_WORKERS", SOLVER_CPUS // 4)))
+SOLVER_THREADS = max(1, SOLVER_CPUS // SOLVER_WORKERS)
+
+
+def _init_worker():
+    numba.set_num_threads(min(SOLVER_THREADS, numba.config.NUMBA_NUM_THREADS))
+    # The config models defer building their validators and serializers; build the ones the solver uses now
+    # rather than on the first job each worker picks up
+    for m in (model.Configuration, model.Recipe, model.Machine, model.MachineSettings):
+        m.model_rebuild()
+
+
+def _make_pool() -> ProcessPoolExecutor:
+    # Not fork: by the time a worker is started or replaced the app process is already running threads (the other
+    # pools' management threads, anyio's thread pool), and a forked child can inherit a lock one of them held
+    return ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("forkserver"), initializer=_init_worker
+    )
+
+
+PROC_POOLS = [_make_pool() for _ in range(SOLVER_WORKERS)]
+
+
+# Building a Controller is the expensive part of a request and only depends on the config, while users
+# mostly tweak iterations. Since every Controller retains thousands of transformations plus their arrays, only
+# a handful are kept per worker. Keyed by config digest, most recently used last.
+CONTROLLER_CACHE_SIZE = 8
+_controllers: OrderedDict[bytes, controller.Controller] = OrderedDict()
+
+
+def _get_controller(config_digest: bytes, config: model.Configuration) -> controller.Controller:
+    if config_digest in _controllers:
+        _controllers.move_to_end(config_digest)
+    else:
+        _controllers[config_digest] = controller.Controller(config)
+        if len(_controllers) > CONTROLLER_CACHE_SIZE:
+            _controllers.popitem(last=False)
+    return _controllers[config_digest]
+
+
+def _compute_costs_worker(config_digest: bytes, config: model.Configuration, iterations: int) -> bytes:
+    costs = _get_controller(config_digest, config).compute_all_costs(iterations)
+    # Encode here: the response bytes are what the app caches, and they're far cheaper to send back from the
+    # worker than the ItemCost objects
+    return _encode_json(ComputeCostsResponse(costs=costs).model_dump())
+
+
+async def _run_solver(config_digest: bytes, config: model.Configuration, iterations: int) -> bytes:
+    shard = int.from_bytes(config_digest) % len(PROC_POOLS)
+    for attempt in range(2):
+        pool = PROC_POOLS[shard]
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                pool, _compute_costs_worker, config_digest, config, iterations
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. it was OOM-killed), which breaks its pool for good. Replace it so later requests
+            # don't keep failing, and retry once since this request may only have been caught up in it.
+            if PROC_POOLS[shard] is pool:
+                PROC_POOLS[shard] = _make_pool()
+                pool.shutdown(wait=False)
+            if attempt:
+                raise
+
+
+# The UI re-posts the same config whenever anything changes, so repeated requests are common.
+# Keyed by (config digest, iterations) and only touched from the event loop, most recently used last. Only the
+# encoded bodies are kept (about 1.2 MB for the default config with quality and recycling enabled).
+COSTS_CACHE_SIZE = 64
+_costs_cache: OrderedDict[tuple[bytes, int], bytes] = OrderedDict()
+
+
+@app.post("/compute_costs", response_class=Response, responses={200: {"model": ComputeCostsResponse}})
+async def compute_costs(request: ComputeCostsRequest) -> Response:
+    # The config models dump non-finite floats as strings, so e.g. an infinite and a NaN speed get different digests
+    config_digest = hashlib.blake2b(request.config.model_dump_json().encode("utf-8"), digest_size=16).digest()
+    key = (config_digest, request.iterations)
+    if key in _costs_cache:
+        _costs_cache.move_to_end(key)
+    else:
+        body = await _run_solver(config_digest, request.config, request.iterations)
+        _costs_cache[key] = body
+        if len(_costs_cache) > COSTS_CACHE_SIZE:
+            _costs_cache.popitem(last=False)
+    return Response(content=_costs_cache[key], media_type="application/json")
 
 
 if __name__ == "__main__":
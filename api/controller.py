@@ -1,8 +1,11 @@
+import functools
 import math
 from collections import defaultdict
 
 import gravis as gv
 import model
+import numba
+import numpy as np
 from pydantic import BaseModel
 
 
@@ -12,6 +15,28 @@ def _Clamp(val, min, max):
     return min if val < min else max if val > max else val
 
 
+@functools.lru_cache
+def _QualitySteps(recipe_quality: int) -> tuple[tuple[int, float], ...]:
+    """(output quality, share of the quality chance) for each quality above recipe_quality.
+
+    Each step up keeps 90% of what reaches it and passes 10% on, with the top quality taking the remainder.
+    Empty for recipes already at the top quality.
+    """
+    steps = []
+    left_over = 1.0
+    curr_multi = 0.9
+    for curr_quality in range(recipe_quality + 1, model.Item.MAX_QUALITY + 1):
+        if curr_quality == model.Item.MAX_QUALITY:
+            curr_multi = left_over
+        steps.append((curr_quality, curr_multi))
+        left_over -= curr_multi
+        curr_multi *= 0.1
+    return tuple(steps)
+
+
+CONVERGENCE_RTOL = 1e-12
+
+
 class ItemCost(BaseModel):
     item: model.Item
     cost: float
@@ -24,20 +49,15 @@ class Transformation:
         self,
         name: str,
         recipe: model.Recipe,
-        recipe_bonuses: model.BonusMap,
         machine: model.Machine,
         machine_settings: model.MachineSettings,
-        mining_bonus: model.Bonus,
+        extra_effects: model.Bonus,
     ):
         self.name = name
         self.recipe = recipe
         self.machine = machine
         self.machine_settings = machine_settings
 
-        extra_effects = machine_settings.effect_total(machine) + recipe_bonuses.get(recipe.name, model.ZERO_BONUS)
-        if recipe.is_mining:
-            extra_effects += mining_bonus
-
         speed_multiplier = _Clamp(1.0 + extra_effects.speed, 0.2, math.inf)
         rate = machine.speed * speed_multiplier / recipe.time
 
@@ -46,59 +66,63 @@ class Transformation:
             self.inputs_per_sec[item] = count * rate
 
         productivty_multiplier = _Clamp(1.0 + extra_effects.productivity, 0, 1.0 + recipe.max_productivity)
-        zero_quality_output_rate: model.ItemCounts = defaultdict(float)
-        for item, count in recipe.outputs.items():
-            zero_quality_output_rate[item] = count * rate * productivty_multiplier
+        # Recipes only have a handful of outputs, so keep them as parallel lists rather than a dict
+        output_items = list(recipe.outputs)
+        output_rates = [count * rate * productivty_multiplier for count in recipe.outputs.values()]
         for item, count in recipe.outputs_no_productivity.items():
-            zero_quality_output_rate[item] += count * rate
+            if item in recipe.outputs:
+                output_rates[output_items.index(item)] += count * rate
+            else:
+                output_items.append(item)
+                output_rates.append(count * rate)
 
         # Deal with net totals:
-        catalysts = set(self.inputs_per_sec.keys()) & set(recipe.outputs.keys())
-        for catalyst in catalysts:
-            if self.inputs_per_sec[catalyst] > zero_quality_output_rate[catalyst]:
-                self.inputs_per_sec[catalyst] -= zero_quality_output_rate[catalyst]
-                del zero_quality_output_rate[catalyst]
-            elif self.inputs_per_sec[catalyst] < zero_quality_output_rate[catalyst]:
-                zero_quality_output_rate[catalyst] -= self.inputs_per_sec[catalyst]
+        for j in range(len(recipe.outputs)):
+            catalyst = output_items[j]
+            if catalyst not in self.inputs_per_sec:
+                continue
+            if self.inputs_per_sec[catalyst] > output_rates[j]:
+                self.inputs_per_sec[catalyst] -= output_rates[j]
+                output_rates[j] = None
+            elif self.inputs_per_sec[catalyst] < output_rates[j]:
+                output_rates[j] -= self.inputs_per_sec[catalyst]
                 del self.inputs_per_sec[catalyst]
             else:
-                del zero_quality_output_rate[catalyst]
+                output_rates[j] = None
                 del self.inputs_per_sec[catalyst]
 
+        solid_outputs = [(i, r) for (i, r) in zip(output_items, output_rates) if r is not None and not i.is_fluid]
+        fluid_outputs = [(i, r) for (i, r) in zip(output_items, output_rates) if r is not None and i.is_fluid]
+
         quality = _Clamp(extra_effects.quality, 0, math.inf)
         self.outputs_per_sec: model.ItemCounts = {
-            model.Item(name=i.name, quality=recipe.quality): rate * (1 - quality)
-            for (i, rate) in zero_quality_output_rate.items()
-            if not i.is_fluid
+            model.MakeItem(i.name, recipe.quality): rate * (1 - quality) for (i, rate) in solid_outputs
         }
-        self.outputs_per_sec.update(
-            {model.Fluid(name=i.name): rate for (i, rate) in zero_quality_output_rate.items() if i.is_fluid}
-        )
+        self.outputs_per_sec.update({model.Fluid(i.name): rate for (i, rate) in fluid_outputs})
 
         if quality:
-            left_over = quality
-            curr_multi = quality * 0.9
-            curr_quality = recipe.quality + 1
-            while curr_quality <= model.Item.MAX_QUALITY:
-                if curr_quality == model.Item.MAX_QUALITY:
-                    curr_multi = left_over
-
-                self.outputs_per_sec.update(
-                    {
-                        model.Item(name=i.name, quality=curr_quality): rate * curr_multi
-                        for (i, rate) in zero_quality_output_rate.items()
-                        if not i.is_fluid
-                    }
-                )
-                left_over -= curr_multi
-                curr_quality += 1
-                curr_multi *= 0.1
+            self.outputs_per_sec.update(
+                {
+                    model.MakeItem(i.name, curr_quality): rate * (quality * multi)
+                    for (curr_quality, multi) in _QualitySteps(recipe.quality)
+                    for (i, rate) in solid_outputs
+                }
+            )
 
     def __repr__(self) -> str:
         return f"{self.name}"
 
 
 def generate_quality_recipes(recipes: list[model.Recipe]):
+    qualities = range(model.Item.MIN_QUALITY, model.Item.MAX_QUALITY + 1)
+    # Every quality variant of an item, built once and shared by all recipes that use it
+    quality_items: dict[model.ItemKey, list[model.ItemKey]] = {}
+
+    def quality_variants(item: model.ItemKey) -> list[model.ItemKey]:
+        if item not in quality_items:
+            quality_items[item] = [model.MakeItem(item.name, quality, item.is_fluid) for quality in qualities]
+        return quality_items[item]
+
     result_recipes = []
     for recipe in recipes:
         no_quality_recipe = (
@@ -107,22 +131,19 @@ def generate_quality_recipes(recipes: list[model.Recipe]):
             or model.BASE_RESOURCE in recipe.inputs
         )
         if not no_quality_recipe:
-            for quality in range(model.Item.MIN_QUALITY, model.Item.MAX_QUALITY + 1):
+            inputs = [(quality_variants(i), count) for (i, count) in recipe.inputs.items()]
+            outputs = [(quality_variants(i), count) for (i, count) in recipe.outputs.items()]
+            for q, quality in enumerate(qualities):
+                # Items are frozen and the replaced dicts are rebuilt, so a shallow unvalidated copy is safe
                 result_recipes.append(
-                    recipe.model_copy(
-                        deep=True,
-                        update={
+                    model.Recipe.model_construct(
+                        **{
+                            **recipe.__dict__,
                             "name": f"{recipe.name}-q{quality}",
-                            "inputs": {
-                                model.MakeItem(i.name, quality, i.is_fluid): count
-                                for (i, count) in recipe.inputs.items()
-                            },
-                            "outputs": {
-                                model.MakeItem(i.name, quality, i.is_fluid): count
-                                for (i, count) in recipe.outputs.items()
-                            },
+                            "inputs": {variants[q]: count for (variants, count) in inputs},
+                            "outputs": {variants[q]: count for (variants, count) in outputs},
                             "quality": quality,
-                        },
+                        }
                     )
                 )
         else:
@@ -130,6 +151,128 @@ def generate_quality_recipes(recipes: list[model.Recipe]):
     return result_recipes
 
 
+class _JsonKey:
+    """Hashable handle on a model that compares by its JSON dump, for use as a cache key."""
+
+    __slots__ = ("model", "json")
+
+    def __init__(self, model: BaseModel):
+        self.model = model
+        self.json = model.model_dump_json()
+
+    def __hash__(self) -> int:
+        return hash(self.json)
+
+    def __eq__(self, other) -> bool:
+        return self.json == other.json
+
+
+# The bonuses don't depend on the recipe beyond its bonus entry and whether it's mining, so they're shared
+# by every quality variant of a recipe and by all recipes made in the same machine.
+@functools.lru_cache(maxsize=4096)
+def _extra_effects(
+    recipe_bonus: _JsonKey, machine: _JsonKey, machine_settings: _JsonKey, mining_bonus: _JsonKey | None
+) -> model.Bonus:
+    extra_effects = machine_settings.model.effect_total(machine.model) + recipe_bonus.model
+    if mining_bonus is not None:
+        extra_effects += mining_bonus.model
+    return extra_effects
+
+
+# Transformations are pure functions of their inputs and are never mutated, so they can be shared
+# between Controllers built from the same (or an overlapping) configuration.
+@functools.lru_cache(maxsize=16384)
+def _build_transformation(
+    recipe: _JsonKey,
+    recipe_bonus: _JsonKey,
+    machine: _JsonKey,
+    machine_settings: _JsonKey,
+    mining_bonus: _JsonKey,
+) -> Transformation:
+    return Transformation(
+        name=f"{recipe.model.name} [{machine_settings.model.name}]",
+        recipe=recipe.model,
+        machine=machine.model,
+        machine_settings=machine_settings.model,
+        extra_effects=_extra_effects(
+            recipe_bonus, machine, machine_settings, mining_bonus if recipe.model.is_mining else None
+        ),
+    )
+
+
+# nnan/ninf are deliberately left out: unreachable items carry an infinite cost through the iteration.
+@numba.njit(cache=True, parallel=True, fastmath={"nsz", "arcp", "contract", "afn", "reassoc"}, boundscheck=False)
+def _iterate_kernel(
+    costs,
+    in_indptr,
+    in_idx,
+    in_val,
+    out_indptr,
+    out_idx,
+    out_val,
+    lower_q_indptr,
+    lower_q_idx,
+    output_counts,
+    time_costs,
+    enable_recycling,
+    base_resource_id,
+    resource_base_cost,
+    n_threads,
+    new_item_values,
+):
+    # Transformations only read the previous costs, so each thread keeps its own running minimum per
+    # item and the buffers are reduced after the parallel loop.
+    new_costs_per_thread = np.full((n_threads, costs.shape[0]), np.inf)
+    for t in numba.prange(in_indptr.shape[0] - 1):
+        thread_costs = new_costs_per_thread[numba.get_thread_id()]
+        total_input_cost = 0.0
+        for j in range(in_indptr[t], in_indptr[t + 1]):
+            total_input_cost += costs[in_idx[j]] * in_val[j]
+
+        input_output_ratio = 0.0
+        if enable_recycling:
+            total_output_cost = 0.0
+            for j in range(out_indptr[t], out_indptr[t + 1]):
+                total_output_cost += costs[out_idx[j]] * out_val[j]
+            if total_output_cost != 0:
+                input_output_ratio = total_input_cost / total_output_cost
+
+        for j in range(out_indptr[t], out_indptr[t + 1]):
+            discount = 0.0
+            if enable_recycling:
+                for k in lower_q_idx[lower_q_indptr[j] : lower_q_indptr[j + 1]]:
+                    discount += costs[out_idx[k]] * out_val[k]
+
+                # Assume 1/4 of wasted outputs can be recreated as input value proportional to output value
+                discount *= 0.25
+                discount *= input_output_ratio
+
+            new_item_value = (time_costs[t] + total_input_cost - discount) / output_counts[j]
+            new_item_values[j] = new_item_value
+            if new_item_value < thread_costs[out_idx[j]]:
+                thread_costs[out_idx[j]] = new_item_value
+
+    new_costs = new_costs_per_thread[0].copy()
+    for tid in range(1, new_costs_per_thread.shape[0]):
+        for i in range(new_costs.shape[0]):
+            if new_costs_per_thread[tid, i] < new_costs[i]:
+                new_costs[i] = new_costs_per_thread[tid, i]
+
+    new_costs[base_resource_id] = resource_base_cost
+    return new_costs
+
+
+@functools.cache
+def _compile_iterate_kernel():
+    """Runs the kernel once on an empty problem so the JIT compile isn't paid by the first real request."""
+    indptr = np.zeros(1, dtype=np.int64)
+    idx = np.zeros(0, dtype=np.int32)
+    val = np.zeros(0, dtype=np.float64)
+    _iterate_kernel(
+        np.ones(1), indptr, idx, val, indptr, idx, val, indptr, idx, val, val, False, 0, 1.0, 1, np.zeros(0)
+    )
+
+
 class Controller:
 
     def __init__(self, config: model.Configuration):
@@ -146,113 +289,170 @@ class Controller:
                 recipe.name: recipe for recipe in recipes if "-recycling" not in recipe.name or "scrap" in recipe.name
             }
 
-        self.transformations: list[Transformation] = []
-        for recipe in self.recipe_map.values():
-            for machine_settings in config.machine_settings_available:
-                uses_prod_modules = machine_settings.module.productivity > 0 or (
-                    machine_settings.beacon and machine_settings.beacon.effect.productivity > 0
+        machine_keys = {category: _JsonKey(machine) for (category, machine) in config.machines.items()}
+        machine_settings_keys = [_JsonKey(machine_settings) for machine_settings in config.machine_settings_available]
+        mining_bonus_key = _JsonKey(config.mining_productivity)
+        zero_bonus_key = _JsonKey(model.ZERO_BONUS)
+
+        # Which machine settings a recipe may use only depends on whether it allows productivity and quality,
+        # so work out the compatible settings once per combination rather than per recipe
+        uses_prod_modules = [
+            machine_settings.module.productivity > 0
+            or (machine_settings.beacon and machine_settings.beacon.effect.productivity > 0)
+            for machine_settings in config.machine_settings_available
+        ]
+        uses_quality_modules = [
+            machine_settings.module.quality > 0
+            or (machine_settings.beacon and machine_settings.beacon.effect.quality > 0)
+            for machine_settings in config.machine_settings_available
+        ]
+        compatible_machine_settings_keys = {
+            (allow_productivity, allow_quality): [
+                machine_settings_key
+                for (machine_settings_key, uses_prod, uses_quality) in zip(
+                    machine_settings_keys, uses_prod_modules, uses_quality_modules
                 )
-                if uses_prod_modules and not recipe.allow_productivity:
-                    continue
-
-                uses_quality_modules = machine_settings.module.quality > 0 or (
-                    machine_settings.beacon and machine_settings.beacon.effect.quality > 0
-                )
-                if uses_quality_modules and (not self.config.enable_quality or not recipe.allow_quality):
-                    continue
+                if not (uses_prod and not allow_productivity)
+                and not (uses_quality and (not self.config.enable_quality or not allow_quality))
+            ]
+            for allow_productivity in (False, True)
+            for allow_quality in (False, True)
+        }
 
-                if recipe.category not in config.machines:
-                    continue
+        self.transformations: list[Transformation] = []
+        for recipe in self.recipe_map.values():
+            if recipe.category not in config.machines:
+                continue
 
+            recipe_key = _JsonKey(recipe)
+            recipe_bonus_key = (
+                _JsonKey(config.recipe_bonuses[recipe.name]) if recipe.name in config.recipe_bonuses else zero_bonus_key
+            )
+            machine_key = machine_keys[recipe.category]
+            for machine_settings_key in compatible_machine_settings_keys[
+                (recipe.allow_productivity, recipe.allow_quality)
+            ]:
                 self.transformations.append(
-                    Transformation(
-                        name=f"{recipe.name} [{machine_settings.name}]",
-                        recipe=recipe,
-                        machine=config.machines[recipe.category],
-                        machine_settings=machine_settings,
-                        recipe_bonuses=config.recipe_bonuses,
-                        mining_bonus=config.mining_productivity,
+                    _build_transformation(
+                        recipe_key, recipe_bonus_key, machine_key, machine_settings_key, mining_bonus_key
                     )
                 )
 
-    def compute_all_costs(self, iterations=100) -> list[ItemCost]:
-        item_costs: dict[model.ItemKey, float] = {}
-
+        # Flatten the transformations into CSR-style arrays keyed by a dense item id so the fixed-point
+        # iteration in compute_all_costs works on NumPy arrays rather than dicts of Items.
+        self.items: list[model.ItemKey] = []
+        self.item_id: dict[model.ItemKey, int] = {}
+
+        def get_item_id(item: model.ItemKey) -> int:
+            if item not in self.item_id:
+                self.item_id[item] = len(self.items)
+                self.items.append(item)
+            return self.item_id[item]
+
+        in_indptr = [0]
+        in_idx = []
+        in_val = []
+        out_indptr = [0]
+        out_idx = []
+        out_val = []
+        # Other outputs of the same item name, split by whether they have a lower quality (recycling
+        # discount, ragged per output) or at-least the same quality (byproduct count, as pairs).
+        lower_q_indptr = [0]
+        lower_q_idx = []
+        at_least_q_pairs = []
         for transformation in self.transformations:
-            for item in transformation.inputs_per_sec:
-                item_costs[item] = self.config.resource_base_cost
-            for item in transformation.outputs_per_sec:
-                item_costs[item] = self.config.resource_base_cost
-
-        def iterate(return_transforms: bool = False):
-            nonlocal item_costs
-            item_to_weighted_transforms: dict[model.ItemKey, list[tuple[float, str]]] = {}
-            new_costs = {}
-            for transformation in self.transformations:
-                total_input_cost = sum(
-                    item_costs[item] * count for (item, count) in transformation.inputs_per_sec.items()
-                )
-                total_output_cost = sum(
-                    item_costs[item] * count for (item, count) in transformation.outputs_per_sec.items()
-                )
-                for item, count in transformation.outputs_per_sec.items():
-                    discount = 0
-                    if self.config.enable_recycling:
-                        for i, c in transformation.outputs_per_sec.items():
-                            if item.name == i.name and item.quality > i.quality:
-                                discount += item_costs[i] * c
-
-                        # Assume 1/4 of wasted outputs can be recreated as input value proportional to output value
-                        discount *= 0.25
-                        discount *= total_input_cost / total_output_cost if total_output_cost else 0
-
-                    # Always assume higher quality byproducts of the same item are at-least as good
-                    # as the item we're considering
-                    count = sum(
-                        c
-                        for (i, c) in transformation.outputs_per_sec.items()
-                        if i.name == item.name and i.quality >= item.quality
-                    )
-                    time_cost = self.config.machine_time_cost
-                    if transformation.recipe.is_mining:
-                        time_cost *= 10
-                    new_item_value = (time_cost + total_input_cost - discount) / count
-
-                    if new_item_value < new_costs.get(item, math.inf):
-                        new_costs[item] = new_item_value
-
-                    if return_transforms:
-                        if item not in item_to_weighted_transforms:
-                            item_to_weighted_transforms[item] = []
-                        item_to_weighted_transforms[item].append((transformation.name, new_item_value))
-
-            for item in item_costs:
-                if item not in new_costs:
-                    new_costs[item] = math.inf
-            new_costs[model.BASE_RESOURCE] = self.config.resource_base_cost
-            item_costs = new_costs
+            for item, count in transformation.inputs_per_sec.items():
+                in_idx.append(get_item_id(item))
+                in_val.append(count)
+            in_indptr.append(len(in_idx))
+
+            # Only outputs sharing a name interact, so bucket them instead of comparing every pair
+            same_name_outputs: dict[str, list[tuple[int, int]]] = defaultdict(list)
+            for item, count in transformation.outputs_per_sec.items():
+                same_name_outputs[item.name].append((len(out_idx), item.quality))
+                out_idx.append(get_item_id(item))
+                out_val.append(count)
+            for j, item in enumerate(transformation.outputs_per_sec, out_indptr[-1]):
+                for k, quality in same_name_outputs[item.name]:
+                    if quality < item.quality:
+                        lower_q_idx.append(k)
+                    else:
+                        at_least_q_pairs.append((j, k))
+                lower_q_indptr.append(len(lower_q_idx))
+            out_indptr.append(len(out_idx))
+        self.base_resource_id = get_item_id(model.BASE_RESOURCE)
+
+        self.in_indptr = np.array(in_indptr, dtype=np.int64)
+        self.in_idx = np.array(in_idx, dtype=np.int32)
+        self.in_val = np.array(in_val, dtype=np.float64)
+        self.out_indptr = np.array(out_indptr, dtype=np.int64)
+        self.out_idx = np.array(out_idx, dtype=np.int32)
+        self.out_val = np.array(out_val, dtype=np.float64)
+        self.lower_q_indptr = np.array(lower_q_indptr, dtype=np.int64)
+        self.lower_q_idx = np.array(lower_q_idx, dtype=np.int32)
+        at_least_q_pairs = np.array(at_least_q_pairs, dtype=np.int32).reshape(-1, 2)
+
+        # Per-transformation constants of the iteration, computed once rather than on every pass
+        is_mining = np.array([t.recipe.is_mining for t in self.transformations], dtype=bool)
+        self._time_cost_per_tx = np.where(is_mining, 10 * config.machine_time_cost, config.machine_time_cost)
+        # Always assume higher quality byproducts of the same item are at-least as good
+        # as the item we're considering
+        self._output_counts = np.bincount(
+            at_least_q_pairs[:, 0], weights=self.out_val[at_least_q_pairs[:, 1]], minlength=len(self.out_idx)
+        ).astype(np.float64)
+        # Used when reporting per-transformation costs; most items have a single producer and need no sorting
+        self._tx_of_output = np.repeat(np.arange(len(self.transformations)), np.diff(self.out_indptr))
+        self._producer_counts = np.bincount(self.out_idx, minlength=len(self.items))
+
+        _compile_iterate_kernel()
 
-            if not return_transforms:
-                return None
-
-            for item, transformation_list in item_to_weighted_transforms.items():
-                transformation_list.sort(key=lambda t: t[1])
-            return item_to_weighted_transforms
-
-        for _ in range(iterations):
-            iterate()
-
-        item_to_weighted_transforms = iterate(return_transforms=True)
-
-        item_costs_list = []
-        for item in item_costs:
-            item_costs_list.append(
-                ItemCost(
-                    item=item, cost=item_costs[item], transformation_costs=item_to_weighted_transforms.get(item, [])
-                )
+    def compute_all_costs(self, iterations=100) -> list[ItemCost]:
+        item_costs = np.full(len(self.items), self.config.resource_base_cost)
+        new_item_values = np.empty(len(self.out_idx))
+
+        def iterate(costs: np.ndarray) -> np.ndarray:
+            return _iterate_kernel(
+                costs,
+                self.in_indptr,
+                self.in_idx,
+                self.in_val,
+                self.out_indptr,
+                self.out_idx,
+                self.out_val,
+                self.lower_q_indptr,
+                self.lower_q_idx,
+                self._output_counts,
+                self._time_cost_per_tx,
+                self.config.enable_recycling,
+                self.base_resource_id,
+                self.config.resource_base_cost,
+                numba.get_num_threads(),
+                new_item_values,
             )
 
-        return item_costs_list
+        # iterations is an upper bound; most configs settle well before it. allclose treats matching
+        # infinities as equal, so items that are still unreachable don't prevent stopping.
+        for _ in range(iterations):
+            new_costs = iterate(item_costs)
+            converged = np.allclose(new_costs, item_costs, rtol=CONVERGENCE_RTOL, atol=0)
+            item_costs = new_costs
+            if converged:
+                break
+        # One extra pass so new_item_values holds every transformation's offer against the final costs
+        item_costs = iterate(item_costs)
+
+        tx_names = [t.name for t in self.transformations]
+        item_to_weighted_transforms: dict[int, list[tuple[str, float]]] = defaultdict(list)
+        for i, t, value in zip(self.out_idx.tolist(), self._tx_of_output.tolist(), new_item_values.tolist()):
+            item_to_weighted_transforms[i].append((tx_names[t], value))
+        for i in np.flatnonzero(self._producer_counts > 1).tolist():
+            item_to_weighted_transforms[i].sort(key=lambda t: t[1])
+
+        # Everything here was just computed from validated inputs, so skip re-validating each ItemCost
+        return [
+            ItemCost.model_construct(item=item, cost=cost, transformation_costs=item_to_weighted_transforms.get(i, []))
+            for i, (item, cost) in enumerate(zip(self.items, item_costs.tolist()))
+        ]
 
     def display_graph(self, item_costs: list[ItemCost]):
         graph = {
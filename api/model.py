@@ -1,9 +1,12 @@
+import functools
 import itertools
-import json
 import math
+import os
 import re
+from collections.abc import Mapping
 from typing import Annotated, Any, ClassVar, Self
 
+import orjson
 from pydantic import (
     BaseModel,
     BeforeValidator,
@@ -12,6 +15,9 @@ from pydantic import (
     WithJsonSchema,
 )
 
+_QUALITY_SUFFIX_RE = re.compile(r"(.*)-q(\d+)$")
+_EXCLUDED_RECIPE_RE = re.compile(r"parameter|bpsb|unknown")
+
 
 class Item(BaseModel):
     model_config = ConfigDict(frozen=True)
@@ -31,7 +37,9 @@ class Item(BaseModel):
         5: "q5",
     }
 
-    def serialize(self) -> str:
+    # Items are frozen (and interned), so the string form is only formatted once per item
+    @functools.cached_property
+    def _serialized(self) -> str:
         if self.is_fluid:
             return f"fluid-{self.name}"
         elif self.quality == 1:
@@ -39,17 +47,33 @@ class Item(BaseModel):
         else:
             return f"{self.name}-q{self.quality}"
 
+    def serialize(self) -> str:
+        return self._serialized
+
+    # Equal items serialize equally, and str hashes are cached, so this is much cheaper than hashing every
+    # field. Equality stays structural because Items can still be built outside MakeItem (e.g. validation).
+    def __hash__(self) -> int:
+        return hash(self._serialized)
+
+    def model_copy(self, *, update: Mapping[str, Any] | None = None, deep: bool = False) -> Self:
+        copy = super().model_copy(update=update, deep=deep)
+        # The cached string form is copied along with the fields and may not match the updated ones
+        copy.__dict__.pop("_serialized", None)
+        return copy
+
     @staticmethod
     def deserialize(data: Any) -> str:
         if not isinstance(data, str):
             return data
 
         if data.startswith("fluid-"):
-            return Item(name=data.removeprefix("fluid-"), is_fluid=True)
-        match = re.match(r"(.*)-q(\d+)", data)
-        if match is not None:
-            return Item(name=match[1], quality=int(match[2]))
-        return Item(name=data)
+            return Fluid(data.removeprefix("fluid-"))
+        # Most items have no quality suffix, so skip the regex unless one could be present
+        if "-q" in data:
+            match = _QUALITY_SUFFIX_RE.match(data)
+            if match is not None:
+                return MakeItem(match[1], int(match[2]))
+        return MakeItem(data)
 
     def __str__(self) -> str:
         return self.serialize()
@@ -65,18 +89,27 @@ ItemKey = Annotated[
 ItemCounts = dict[ItemKey, float]
 
 
-def MakeItem(name: str, quality: int = Item.MIN_QUALITY, is_fluid: bool = False):
+# Items are frozen, so equal items can share a single instance. Recipes mention the same few hundred items
+# over and over, and shared keys let dict lookups short-circuit on identity.
+@functools.lru_cache(maxsize=1 << 16)
+def _InternedItem(name: str, quality: int, is_fluid: bool) -> Item:
+    return Item(name=name, quality=quality, is_fluid=is_fluid)
+
+
+def MakeItem(name: str, quality: int = Item.MIN_QUALITY, is_fluid: bool = False) -> Item:
     if is_fluid:
-        return Fluid(name=name)
-    return Item(name=name, quality=quality)
+        return Fluid(name)
+    return _InternedItem(name, quality, False)
 
 
 def Fluid(name: str) -> Item:
-    return Item(name=name, is_fluid=True)
+    return _InternedItem(name, Item.MIN_QUALITY, True)
 
 
+# The config models below build their validators on first use instead of at import (the API's solver workers
+# build them up front). Item and Bonus don't defer, since BASE_RESOURCE and ZERO_BONUS are built at import.
 class Recipe(BaseModel):
-    model_config = ConfigDict(ser_json_inf_nan="strings")
+    model_config = ConfigDict(ser_json_inf_nan="strings", defer_build=True)
 
     name: str
     category: str
@@ -92,6 +125,8 @@ class Recipe(BaseModel):
 
 
 class Bonus(BaseModel):
+    model_config = ConfigDict(ser_json_inf_nan="strings")
+
     name: str
     speed: float = 0.0
     productivity: float = 0.0
@@ -123,12 +158,16 @@ BonusMap = dict[str, Bonus]
 
 
 class Beacon(BaseModel):
+    model_config = ConfigDict(ser_json_inf_nan="strings", defer_build=True)
+
     name: str
     transmission: float
     effect: Bonus
 
 
 class Machine(BaseModel):
+    model_config = ConfigDict(ser_json_inf_nan="strings", defer_build=True)
+
     name: str
     speed: float = 1.0
     module_slots: int = 0
@@ -145,6 +184,8 @@ class Machine(BaseModel):
 
 
 class MachineSettings(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     name: str
     module: Bonus  # only one type of module per machine
     num_beacons: int = 0
@@ -158,6 +199,8 @@ class MachineSettings(BaseModel):
 
 
 class Configuration(BaseModel):
+    model_config = ConfigDict(ser_json_inf_nan="strings", defer_build=True)
+
     name: str
     enable_quality: bool = False
     enable_recycling: bool = False
@@ -170,7 +213,7 @@ class Configuration(BaseModel):
     recipes: list[Recipe]
 
 
-BASE_RESOURCE = Item(name="resource")
+BASE_RESOURCE = MakeItem("resource")
 
 
 def _OutputMaps(products) -> tuple[ItemCounts, ItemCounts]:
@@ -180,43 +223,69 @@ def _OutputMaps(products) -> tuple[ItemCounts, ItemCounts]:
         expected = product.get("amount")
         if expected is None:
             expected = (product["amount_min"] + product["amount_max"]) * 0.5
-        expected *= product.get("probability", 1.0)
-        item = Item(name=product["name"], is_fluid=product["type"] == "fluid")
-        if product.get("ignored_by_productivity", 0) > expected:
-            outputs[item] = 0
+        expected = float(expected * product.get("probability", 1.0))
+        item = MakeItem(product["name"], is_fluid=product["type"] == "fluid")
+        ignored_by_productivity = product.get("ignored_by_productivity", 0)
+        if ignored_by_productivity > expected:
+            outputs[item] = 0.0
             outputs_no_prod[item] = expected
-        elif product.get("ignored_by_productivity", 0) > 0:
-            outputs[item] = expected - product.get("ignored_by_productivity", 0)
-            outputs_no_prod[item] = product.get("ignored_by_productivity", 0)
+        elif ignored_by_productivity > 0:
+            outputs[item] = expected - ignored_by_productivity
+            outputs_no_prod[item] = float(ignored_by_productivity)
         else:
             outputs[item] = expected
 
     return outputs, outputs_no_prod
 
 
+# The loaders read a trusted, well-formed Factorio data dump, so models are built with model_construct to skip
+# validation. Values are converted to the field types by hand instead.
+def _MinableRecipe(
+    name: str,
+    minable: dict[Any, Any],
+    *,
+    category: str,
+    time: float,
+    max_productivity: float,
+    allow_productivity: bool,
+    allow_quality: bool,
+    is_mining: bool,
+) -> Recipe:
+    inputs = {BASE_RESOURCE: 1.0}
+    if "required_fluid" in minable:
+        # Not sure why the prototype says 10x the actual fluid needed...
+        inputs[Fluid(minable["required_fluid"])] = minable["fluid_amount"] * 0.1
+    if "results" in minable:
+        outputs, outputs_no_prod = _OutputMaps(minable["results"])
+    else:
+        outputs = {}
+        outputs[MakeItem(minable["result"])] = float(minable.get("count", 1))
+        outputs_no_prod = {}
+    return Recipe.model_construct(
+        name=name,
+        category=category,
+        time=time,
+        inputs=inputs,
+        outputs=outputs,
+        outputs_no_productivity=outputs_no_prod,
+        max_productivity=max_productivity,
+        allow_productivity=allow_productivity,
+        allow_quality=allow_quality,
+        is_mining=is_mining,
+    )
+
+
 def LoadDataDumpRecipes(prototypes: dict[Any, Any]) -> list[Recipe]:
     recipes = []
 
     for r in prototypes["resource"].values():
         minable = r["minable"]
-        inputs = {BASE_RESOURCE: 1}
-        if "required_fluid" in minable:
-            # Not sure why the prototype says 10x the actual fluid needed...
-            inputs[Fluid(name=minable["required_fluid"])] = minable["fluid_amount"] * 0.1
-        if "results" in minable:
-            outputs, outputs_no_prod = _OutputMaps(minable["results"])
-        else:
-            outputs = {}
-            outputs[Item(name=minable["result"])] = float(minable.get("count", 1))
-            outputs_no_prod = {}
         recipes.append(
-            Recipe(
-                name=r["name"],
+            _MinableRecipe(
+                r["name"],
+                minable,
                 category=r.get("category", "basic-solid"),
-                time=minable["mining_time"],
-                inputs=inputs,
-                outputs=outputs,
-                outputs_no_productivity=outputs_no_prod,
+                time=float(minable["mining_time"]),
                 max_productivity=math.inf,
                 allow_productivity=True,
                 allow_quality=True,
@@ -225,26 +294,13 @@ def LoadDataDumpRecipes(prototypes: dict[Any, Any]) -> list[Recipe]:
         )
 
     for p in prototypes["plant"].values():
-        minable = p["minable"]
-        inputs = {BASE_RESOURCE: 1}
-        if "required_fluid" in minable:
-            # Not sure why the prototype says 10x the actual fluid needed...
-            inputs[Fluid(name=minable["required_fluid"])] = minable["fluid_amount"] * 0.1
-        if "results" in minable:
-            outputs, outputs_no_prod = _OutputMaps(minable["results"])
-        else:
-            outputs = {}
-            outputs[Item(name=minable["result"])] = float(minable.get("count", 1))
-            outputs_no_prod = {}
         recipes.append(
-            Recipe(
-                name=p["name"],
+            _MinableRecipe(
+                p["name"],
+                p["minable"],
                 category="agricultural-tower",
                 time=60 / p["growth_ticks"],
-                inputs=inputs,
-                outputs=outputs,
-                outputs_no_productivity=outputs_no_prod,
-                max_productivity=0,
+                max_productivity=0.0,
                 allow_productivity=False,
                 allow_quality=False,
                 is_mining=False,
@@ -254,26 +310,13 @@ def LoadDataDumpRecipes(prototypes: dict[Any, Any]) -> list[Recipe]:
     for p in prototypes["asteroid-chunk"].values():
         if "minable" not in p:
             continue
-        minable = p["minable"]
-        inputs = {BASE_RESOURCE: 1}
-        if "required_fluid" in minable:
-            # Not sure why the prototype says 10x the actual fluid needed...
-            inputs[Fluid(name=minable["required_fluid"])] = minable["fluid_amount"] * 0.1
-        if "results" in minable:
-            outputs, outputs_no_prod = _OutputMaps(minable["results"])
-        else:
-            outputs = {}
-            outputs[Item(name=minable["result"])] = float(minable.get("count", 1))
-            outputs_no_prod = {}
         recipes.append(
-            Recipe(
-                name=p["name"],
+            _MinableRecipe(
+                p["name"],
+                p["minable"],
                 category="asteroid-collector",
-                time=1,  # TODO: come up with something reasonable
-                inputs=inputs,
-                outputs=outputs,
-                outputs_no_productivity=outputs_no_prod,
-                max_productivity=0,
+                time=1.0,  # TODO: come up with something reasonable
+                max_productivity=0.0,
                 allow_productivity=False,
                 allow_quality=False,
                 is_mining=False,
@@ -281,18 +324,20 @@ def LoadDataDumpRecipes(prototypes: dict[Any, Any]) -> list[Recipe]:
         )
 
     for r in prototypes["recipe"].values():
-        inputs = {Item(name=i["name"], is_fluid=i["type"] == "fluid"): i["amount"] for i in r.get("ingredients", [])}
+        inputs = {
+            MakeItem(i["name"], is_fluid=i["type"] == "fluid"): float(i["amount"]) for i in r.get("ingredients", [])
+        }
         results = r.get("results", [])
         outputs, outputs_no_prod = _OutputMaps(results)
         recipes.append(
-            Recipe(
+            Recipe.model_construct(
                 name=r["name"],
                 category=r.get("category", "crafting"),
-                time=r.get("energy_required", 0.5),
+                time=float(r.get("energy_required", 0.5)),
                 inputs=inputs,
                 outputs=outputs,
                 outputs_no_productivity=outputs_no_prod,
-                max_productivity=r.get("maximum_productivity", 3.0),
+                max_productivity=float(r.get("maximum_productivity", 3.0)),
                 allow_productivity=r.get("allow_productivity", False),
                 allow_quality=r.get("allow_quality", True),
             )
@@ -306,7 +351,7 @@ def LoadDataDumpRecipes(prototypes: dict[Any, Any]) -> list[Recipe]:
             continue
         pumped_fluids.add(t["fluid"])
         recipes.append(
-            Recipe(
+            Recipe.model_construct(
                 name=f"offshore-pump-{t["fluid"]}",
                 category="offshore-pump",
                 time=1.0,
@@ -318,9 +363,7 @@ def LoadDataDumpRecipes(prototypes: dict[Any, Any]) -> list[Recipe]:
             )
         )
 
-    recipes = [r for r in recipes if "parameter" not in r.name]
-    recipes = [r for r in recipes if "bpsb" not in r.name]
-    recipes = [r for r in recipes if "unknown" not in r.name]
+    recipes = [r for r in recipes if not _EXCLUDED_RECIPE_RE.search(r.name)]
 
     return recipes
 
@@ -331,19 +374,19 @@ def LoadDataDumpMachines(prototypes: dict[Any, Any]) -> dict[str, Machine]:
         prototypes["assembling-machine"].values(), prototypes["furnace"].values(), prototypes["mining-drill"].values()
     ):
         effects = m.get("effect_receiver", {}).get("base_effect", {})
-        base_effect = Bonus(
+        base_effect = Bonus.model_construct(
             name="base",
-            speed=effects.get("speed", 0.0),
-            productivity=effects.get("productivity", 0.0),
-            quality=effects.get("quality", 0.0),
+            speed=float(effects.get("speed", 0.0)),
+            productivity=float(effects.get("productivity", 0.0)),
+            quality=float(effects.get("quality", 0.0)),
         )
-        machine = Machine(
+        machine = Machine.model_construct(
             name=m["name"],
-            speed=m.get("crafting_speed") or m.get("mining_speed"),
+            speed=float(m.get("crafting_speed") or m.get("mining_speed")),
             module_slots=m.get("module_slots", 0),
             base_effect=base_effect,
         )
-        for category in m.get("crafting_categories", []) + m.get("resource_categories", []):
+        for category in itertools.chain(m.get("crafting_categories", ()), m.get("resource_categories", ())):
             if category not in machines:
                 machines[category] = machine
                 continue
@@ -351,27 +394,53 @@ def LoadDataDumpMachines(prototypes: dict[Any, Any]) -> dict[str, Machine]:
             machines[category] = max(machine, machines[category])
 
     p = prototypes["offshore-pump"]["offshore-pump"]
-    machines["offshore-pump"] = Machine(
+    machines["offshore-pump"] = Machine.model_construct(
         name=p["name"],
-        speed=p["pumping_speed"],
+        speed=float(p["pumping_speed"]),
     )
 
     t = prototypes["agricultural-tower"]["agricultural-tower"]
     farming_diameter = t["radius"] * 2 + 1
-    machines["agricultural-tower"] = Machine(
+    machines["agricultural-tower"] = Machine.model_construct(
         name=t["name"],
-        speed=farming_diameter**2 - 1,
+        speed=float(farming_diameter**2 - 1),
     )
 
     c = prototypes["asteroid-collector"]["asteroid-collector"]
-    machines["asteroid-collector"] = Machine(
+    machines["asteroid-collector"] = Machine.model_construct(
         name=c["name"],
-        speed=c["arm_speed_base"] * c["arm_count_base"],
+        speed=float(c["arm_speed_base"] * c["arm_count_base"]),
     )
 
     return machines
 
 
+# The prototype types read by LoadDataDumpRecipes and LoadDataDumpMachines
+_PROTOTYPE_TYPES = (
+    "resource",
+    "plant",
+    "asteroid-chunk",
+    "recipe",
+    "tile",
+    "assembling-machine",
+    "furnace",
+    "mining-drill",
+    "offshore-pump",
+    "agricultural-tower",
+    "asteroid-collector",
+)
+
+
+# Parsing the data dump dominates building the default configuration, so keep the last parse around for as
+# long as the file on disk is unchanged. The loaders only read from the prototypes, and only the types they use
+# are retained since the rest of the dump is most of its size.
+@functools.lru_cache(maxsize=1)
+def _LoadPrototypes(path: str, mtime: float) -> dict[Any, Any]:
+    with open(path, "rb") as f:
+        prototypes = orjson.loads(f.read())
+    return {prototype_type: prototypes[prototype_type] for prototype_type in _PROTOTYPE_TYPES}
+
+
 def MakeDefaultConfiguration() -> Configuration:
 
     speed_module = Bonus(name="speed_3", speed=0.5, quality=-0.025)
@@ -380,8 +449,7 @@ def MakeDefaultConfiguration() -> Configuration:
     # quality_module = Bonus(name="quality_3", quality=0.025, speed=-0.05)
     quality_module = Bonus(name="legendary_quality_3", quality=0.062, speed=-0.05)
 
-    with open("data-raw-dump.json") as f:
-        prototypes = json.load(f)
+    prototypes = _LoadPrototypes("data-raw-dump.json", os.path.getmtime("data-raw-dump.json"))
 
     recipes = LoadDataDumpRecipes(prototypes)
     machines = LoadDataDumpMachines(prototypes)